@@ -20,7 +20,13 @@ import time as t
 import random
 import os
 import socket
+import threading
+import atexit
+import signal
+import sys
 from paho.mqtt import client as mqtt_client
+import orno_export
+import orno_profile
 from datetime import datetime
 
 WE514            = 0
@@ -87,7 +93,7 @@ Total_Export_Active_Power     =    -1,    -1,0x0502
 Total_Export_Power            =    -1,    -1,0x004A
 
 class orno:
-  def __init__(self, port, slave_id=1, useMQTT=False, debug=False, log=True, logFile="", type=0):
+  def __init__(self, port, slave_id=1, useMQTT=False, debug=False, log=True, logFile="", type=0, profile=False):
     self.debug = debug
     self.log = log
     self.logFile = logFile
@@ -96,6 +102,9 @@ class orno:
     self.port = port
     self.slave_id = slave_id
     self.polling_interval = 5
+    self.tracer = None
+    self.profile_summary_interval = 60
+    self.profile_cycles = 0
     if type == WE514:
         self.fc=3
     elif type == WE516:
@@ -124,6 +133,9 @@ class orno:
     self.smartmeter.debug = debug
     self.useMQTT = useMQTT
     self.isMQTT_connected = False
+    self.sinks = []
+    self.logLock = threading.Lock()
+    self.sinks_atexit = False
     if self.useMQTT:
       self.mqtt_broker='localhost'
       self.mqtt_port=1886
@@ -141,13 +153,16 @@ class orno:
         self.logMessage(f"{self.smartmeter}")
       except IOError as ioError:
         print(f"ORNO Error: Cannot create logfile: {ioError}")
+    if profile:
+      self.profile_enable()
 
   def logMessage(self, message):
     if self.log:
       try:
-        self.txt = datetime.now().strftime("%Y%m%d %H:%M:%S>> ")+ f"{message}\n"
-        self.logFH.write(self.txt)
-        self.logFH.flush()
+        txt = datetime.now().strftime("%Y%m%d %H:%M:%S>> ")+ f"{message}\n"
+        with self.logLock:
+          self.logFH.write(txt)
+          self.logFH.flush()
       except IOError as ioError:
         print(f"ORNO Error: Cannot log message '{message}:\n{ioError}")
 
@@ -241,6 +256,78 @@ class orno:
 
   def read_float(self, register=0, num=2, code=3, order=0):
       return self.smartmeter.read_float(register,code,num,order)
+
+  def readings(self):
+    # Values of the last query(), named like the MQTT topics below mqtt_topic.
+    if self.type == SDM72DV2:
+      return {
+        "L1_Voltage": self.L1_voltage, "L1_Power": self.L1_APower,
+        "L2_Voltage": self.L2_voltage, "L2_Power": self.L2_APower,
+        "L3_Voltage": self.L3_voltage, "L3_Power": self.L3_APower,
+        "GridFrequency": self.GridFrequency, "TotalPower": self.Net_Power,
+        "ImportPower": self.Total_Import_Active_Power, "ExportPower": self.Total_Export_Active_Power,
+        "TotalExportPower": self.Total_Export_Power }
+    if self.type == WE514:
+      return {
+        "L1_Voltage": self.L1_voltage, "L1_Frequency": self.L1_frequency, "L1_Current": self.L1_current,
+        "L1_Power": self.L1_power, "L1_ActivePower": self.L1_APower, "L1_ReactivePower": self.L1_RPower,
+        "L1_ApparentPower": self.L1_ApPower, "L1_PF": self.L1_PF, "TotalPower": self.TotalPower }
+    if self.type == WE517:
+      values = {}
+      for phase in ("L1", "L2", "L3"):
+        values[f"{phase}_Voltage"]              = getattr(self, f"{phase}_voltage")
+        values[f"{phase}_Frequency"]            = getattr(self, f"{phase}_frequency")
+        values[f"{phase}_Current"]              = getattr(self, f"{phase}_current")
+        values[f"{phase}_Power"]                = getattr(self, f"{phase}_power")
+        values[f"{phase}_ActivePower"]          = getattr(self, f"{phase}_APower")
+        values[f"{phase}_ReactivePower"]        = getattr(self, f"{phase}_RPower")
+        values[f"{phase}_ApparentPower"]        = getattr(self, f"{phase}_ApPower")
+        values[f"{phase}_PF"]                   = getattr(self, f"{phase}_PF")
+        values[f"{phase}_ActiveEnergy"]         = getattr(self, f"{phase}_AEnergy")
+        values[f"{phase}_ForwardActiveEnergy"]  = getattr(self, f"{phase}_FAEnergy")
+        values[f"{phase}_ReverseActiveEnergy"]  = getattr(self, f"{phase}_RAEnergy")
+      values["GridFrequency"]             = self.L1_frequency
+      values["Total_ActivePower"]         = self.TotalActivePower
+      values["Total_ReactivePower"]       = self.TotalReactivePower
+      values["Total_ApparentPower"]       = self.TotalApparentPower
+      values["Total_PF"]                  = self.TotalPF
+      values["Total_ActiveEnergy"]        = self.TotalActiveEnergy
+      values["Total_ForwardActiveEnergy"] = self.TotalForwardActiveEnergy
+      values["Total_ReverseActiveEnergy"] = self.TotalReverseActiveEnergy
+      for tariff in ("T1", "T2", "T3", "T4"):
+        values[f"{tariff}_Total_ActiveEnergy"]        = getattr(self, f"{tariff}_TotalActiveEnergy")
+        values[f"{tariff}_Total_ForwardActiveEnergy"] = getattr(self, f"{tariff}_ForwardActiveEnergy")
+        values[f"{tariff}_Total_ReverseActiveEnergy"] = getattr(self, f"{tariff}_ReverseActiveEnergy")
+      return values
+    return {}
+
+  def add_sink(self, writer, batch_size=100, flush_interval=10, queue_size=1000, handle_sigterm=False):
+    if not self.sinks_atexit:
+      self.sinks_atexit = True
+      # Flush and close the sinks when the interpreter exits (also on Ctrl+C).
+      atexit.register(self.close_sinks)
+    if handle_sigterm and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+      # Opt-in: turns SIGTERM (systemd stop) into a normal exit, so the atexit hook runs.
+      signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # The logger looks up logMessage at call time, so profile_enable/disable also applies to sinks.
+    sink = orno_export.Sink(writer, batch_size, flush_interval, queue_size, logger=lambda message: self.logMessage(message))
+    self.sinks.append(sink)
+    self.logMessage(f"Added export sink {type(writer).__name__} (batch_size={batch_size}, flush_interval={flush_interval})")
+    return sink
+
+  def export(self):
+    # Hands the last query() to every sink; never blocks on a slow sink.
+    if self.sinks:
+      record = (datetime.now(), self.readings())
+      for sink in self.sinks:
+        sink.offer(record)
+
+  def close_sinks(self, timeout=None):
+    for sink in self.sinks:
+      sink.close(timeout)
+      if sink.dropped > 0:
+        self.logMessage(f"Sink {type(sink.writer).__name__}: {sink.dropped} records dropped (sink too slow)")
+    self.sinks = []
   
   def print(self):
     if self.type == SDM72DV2:
@@ -328,19 +415,64 @@ class orno:
       self.logMessage(f"Start polling every {self.polling_interval} seconds slave id '{self.slave_id}'")
     if infinite and count < 1:
       while True:
-        self.query()
-        if self.useMQTT:
-          self.mqtt_publish()
+        self.cycle()
+        if self.tracer is not None:
+          self.profile_report()
         t.sleep(self.polling_interval)
     else:
       for i in range(0,count):
-        self.query()
-        if self.useMQTT:
-           self.mqtt_publish()
+        self.cycle()
+        if self.tracer is not None:
+          self.profile_report()
         t.sleep(self.polling_interval)
     if self.useMQTT:
           self.client.loop(0.10)
  
+  def cycle(self):
+    self.query()
+    self.export()
+    if self.useMQTT:
+      self.mqtt_publish()
+
+  def profile_report(self):
+    # Logs the rolling summary every profile_summary_interval cycles.
+    self.profile_cycles = self.profile_cycles + 1
+    if self.profile_summary_interval > 0 and self.profile_cycles % self.profile_summary_interval == 0:
+      self.logMessage(f"Profile last {self.profile_summary_interval} cycles: {self.tracer.summary()}")
+
+  def profile_enable(self, max_events=100000):
+    # Wraps the methods of this instance with timing spans; without profiling nothing is wrapped.
+    if self.tracer is not None:
+      return
+    self.tracer = orno_profile.Tracer(max_events)
+    self.profile_cycles = 0
+    self.smartmeter.read_register = self.tracer.wrap(self.smartmeter.read_register, "modbus", "bus", orno_profile.register_args)
+    self.smartmeter.read_float    = self.tracer.wrap(self.smartmeter.read_float, "modbus", "bus", orno_profile.float_args)
+    if hasattr(self.smartmeter, "_communicate"):
+      self.smartmeter._communicate = self.tracer.wrap(self.smartmeter._communicate, "serial", "bus", orno_profile.serial_args)
+    self.cycle        = self.tracer.wrap(self.cycle, "cycle", "cycle")
+    self.query        = self.tracer.wrap(self.query, "query", "query")
+    self.export       = self.tracer.wrap(self.export, "export", "export")
+    self.mqtt_publish = self.tracer.wrap(self.mqtt_publish, "publish", "mqtt")
+    self.logMessage   = self.tracer.wrap(self.logMessage, "log", "log")
+    self.logMessage(f"Profiling enabled")
+
+  def profile_disable(self):
+    if self.tracer is None:
+      return
+    for name in ("read_register", "read_float", "_communicate"):
+      self.smartmeter.__dict__.pop(name, None)
+    for name in ("cycle", "query", "export", "mqtt_publish", "logMessage"):
+      self.__dict__.pop(name, None)
+    self.logMessage(f"Profiling disabled: {self.tracer.summary()}")
+    self.tracer = None
+
+  def profile_save(self, fileName):
+    # Chrome trace format, open with chrome://tracing or https://ui.perfetto.dev
+    if self.tracer is not None:
+      self.tracer.save(fileName)
+      self.logMessage(f"Profile trace saved to {fileName}")
+
   def mqtt_prepareTopics(self, type=0):
     if type == SDM72DV2:
       self.L1U   = f"{self.mqtt_topic}/L1_Voltage"
@@ -0,0 +1,202 @@
+#
+# ORNO Export Pipeline
+#
+# Streams the readings of every orno.query() to one or more sinks (CSV, Parquet,
+# InfluxDB line protocol files or InfluxDB HTTP batches) without going through MQTT.
+#
+# Every sink owns a bounded queue and a worker thread. The poll loop only hands the
+# record over to the queue; if a sink cannot keep up the oldest queued record is
+# dropped, so a slow sink never stalls the Modbus polling.
+#
+# Author: Marc-Oliver Blumenauer
+#         marc@l3c.de
+#
+# License: MIT
+#
+import csv
+import math
+import os
+import queue
+import threading
+import time as t
+import urllib.request
+
+
+def batches(records, batch_size=100, flush_interval=10, stop=None):
+  # Generator pulling records from a queue and yielding lists of up to batch_size
+  # records. A partial batch is yielded once flush_interval seconds have passed since
+  # its first record, or when stop is set.
+  batch = []
+  deadline = None
+  while True:
+    timeout = 0.5 if deadline is None else max(0, min(0.5, deadline - t.monotonic()))
+    try:
+      record = records.get(timeout=timeout)
+      if not batch:
+        deadline = t.monotonic() + flush_interval
+      batch.append(record)
+    except queue.Empty:
+      pass
+    stopping = stop is not None and stop.is_set() and records.empty()
+    if batch and (len(batch) >= batch_size or t.monotonic() >= deadline or stopping):
+      yield batch
+      batch = []
+      deadline = None
+    if stopping:
+      return
+
+
+class Sink:
+  def __init__(self, writer, batch_size=100, flush_interval=10, queue_size=1000, logger=print):
+    self.writer = writer
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.logger = logger
+    self.dropped = 0
+    self.written = 0
+    self.records = queue.Queue(maxsize=queue_size)
+    self.stopEvent = threading.Event()
+    self.thread = threading.Thread(target=self.run, name=f"orno-sink-{type(writer).__name__}", daemon=True)
+    self.thread.start()
+
+  def offer(self, record):
+    # Never blocks: when the queue is full the oldest record is dropped.
+    while True:
+      try:
+        self.records.put_nowait(record)
+        return
+      except queue.Full:
+        try:
+          self.records.get_nowait()
+          self.dropped = self.dropped + 1
+        except queue.Empty:
+          pass
+
+  def run(self):
+    for batch in batches(self.records, self.batch_size, self.flush_interval, self.stopEvent):
+      try:
+        self.writer.write(batch)
+        self.written = self.written + len(batch)
+      except Exception as err:
+        self.logger(f"Sink {type(self.writer).__name__} ERROR: dropped batch of {len(batch)} records: {err}")
+    try:
+      self.writer.close()
+    except Exception as err:
+      self.logger(f"Sink {type(self.writer).__name__} ERROR on close: {err}")
+
+  def close(self, timeout=None):
+    self.stopEvent.set()
+    self.thread.join(timeout)
+
+
+class CSVWriter:
+  def __init__(self, fileName):
+    self.fileName = fileName
+    self.fieldnames = None
+    self.fh = None
+    self.csvWriter = None
+
+  def write(self, batch):
+    if self.csvWriter is None:
+      self.fieldnames = ["time"] + list(batch[0][1].keys())
+      writeHeader = not os.path.exists(self.fileName) or os.path.getsize(self.fileName) == 0
+      self.fh = open(self.fileName, "a", newline="")
+      self.csvWriter = csv.DictWriter(self.fh, fieldnames=self.fieldnames, extrasaction="ignore")
+      if writeHeader:
+        self.csvWriter.writeheader()
+    for timestamp, fields in batch:
+      self.csvWriter.writerow({"time": timestamp.isoformat(), **fields})
+    self.fh.flush()
+
+  def close(self):
+    if self.fh is not None:
+      self.fh.close()
+
+
+class ParquetWriter:
+  # Every batch is written as one row group. Requires pyarrow (pip3 install pyarrow).
+  def __init__(self, fileName):
+    try:
+      import pyarrow
+      import pyarrow.parquet
+    except ImportError as importError:
+      raise ImportError(f"ORNO Error: ParquetWriter requires pyarrow: {importError}")
+    self.pa = pyarrow
+    self.pq = pyarrow.parquet
+    self.fileName = fileName
+    self.parquetWriter = None
+
+  def write(self, batch):
+    # The schema is fixed by the first batch: all readings are stored as float64, so a
+    # column that is None in the first batch does not become type null.
+    if self.parquetWriter is None:
+      fields = [self.pa.field("time", self.pa.timestamp("us"))]
+      fields = fields + [self.pa.field(name, self.pa.float64()) for name in batch[0][1].keys()]
+      self.parquetWriter = self.pq.ParquetWriter(self.fileName, self.pa.schema(fields))
+    schema = self.parquetWriter.schema
+    columns = [self.pa.array([timestamp for timestamp, values in batch], type=schema.field(0).type)]
+    for field in list(schema)[1:]:
+      columns.append(self.pa.array([values.get(field.name) for timestamp, values in batch], type=field.type))
+    self.parquetWriter.write_table(self.pa.Table.from_arrays(columns, schema=schema))
+
+  def close(self):
+    if self.parquetWriter is not None:
+      self.parquetWriter.close()
+
+
+def influx_escape(value):
+  return str(value).replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def influx_lines(batch, measurement="SmartMeter", tags=None):
+  prefix = influx_escape(measurement)
+  if tags:
+    prefix = prefix + "".join(f",{influx_escape(k)}={influx_escape(v)}" for k, v in sorted(tags.items()))
+  lines = []
+  for timestamp, fields in batch:
+    values = ",".join(f"{influx_escape(k)}={float(v)}" for k, v in fields.items() if v is not None and math.isfinite(v))
+    if values:
+      lines.append(f"{prefix} {values} {int(timestamp.timestamp() * 1000000) * 1000}")
+  return lines
+
+
+class InfluxFileWriter:
+  def __init__(self, fileName, measurement="SmartMeter", tags=None):
+    self.fileName = fileName
+    self.measurement = measurement
+    self.tags = tags
+    self.fh = open(self.fileName, "a")
+
+  def write(self, batch):
+    for line in influx_lines(batch, self.measurement, self.tags):
+      self.fh.write(f"{line}\n")
+    self.fh.flush()
+
+  def close(self):
+    self.fh.close()
+
+
+class InfluxHTTPWriter:
+  # Posts every batch to an InfluxDB write endpoint, e.g.
+  #   InfluxDB 1.x: http://localhost:8086/write?db=smartmeter
+  #   InfluxDB 2.x: http://localhost:8086/api/v2/write?org=home&bucket=smartmeter&precision=ns
+  def __init__(self, url, measurement="SmartMeter", tags=None, token="", timeout=5):
+    self.url = url
+    self.measurement = measurement
+    self.tags = tags
+    self.token = token
+    self.timeout = timeout
+
+  def write(self, batch):
+    lines = influx_lines(batch, self.measurement, self.tags)
+    if not lines:
+      return
+    request = urllib.request.Request(self.url, data="\n".join(lines).encode("utf-8"), method="POST")
+    request.add_header("Content-Type", "text/plain; charset=utf-8")
+    if self.token != "":
+      request.add_header("Authorization", f"Token {self.token}")
+    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+      response.read()
+
+  def close(self):
+    pass
@@ -0,0 +1,112 @@
+#
+# ORNO Profiling
+#
+# Per-stage timing of the poll-publish cycle: Modbus transactions (register, bytes,
+# latency), serial I/O, decode, MQTT publish, export and logging.
+#
+# The Tracer does not touch the orno class by itself. orno.profile_enable() wraps the
+# methods of one instance, so nothing is measured - and nothing costs - while profiling
+# is off. Traces can be saved in Chrome trace format (chrome://tracing, Perfetto).
+#
+# Author: Marc-Oliver Blumenauer
+#         marc@l3c.de
+#
+# License: MIT
+#
+import functools
+import json
+import os
+import threading
+import time as t
+from collections import deque
+
+
+class Tracer:
+  def __init__(self, max_events=100000):
+    self.pid = os.getpid()
+    self.origin = t.perf_counter()
+    self.events = deque(maxlen=max_events)
+    self.lock = threading.Lock()
+    self.stats = {}
+    self.registers = {}
+
+  def record(self, name, category, start, end, args=None):
+    # end is taken before the span args are built, so the time from end until the
+    # counters are updated is the tracing overhead of this span (stat[3]).
+    duration = end - start
+    event = {"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": threading.get_ident(),
+             "ts": (start - self.origin) * 1000000, "dur": duration * 1000000}
+    if args:
+      event["args"] = args
+    with self.lock:
+      self.events.append(event)
+      stat = self.stats.setdefault(name, [0, 0.0, 0.0, 0.0])
+      stat[0] = stat[0] + 1
+      stat[1] = stat[1] + duration
+      stat[2] = max(stat[2], duration)
+      if args and "register" in args:
+        register = self.registers.setdefault(args["register"], [0, 0.0, 0.0])
+        register[0] = register[0] + 1
+        register[1] = register[1] + duration
+        register[2] = max(register[2], duration)
+      stat[3] = stat[3] + t.perf_counter() - end
+
+  def wrap(self, function, name, category, argsFunction=None):
+    @functools.wraps(function)
+    # argsFunction gets the result (None on an exception) followed by the call arguments.
+    def traced(*args, **kwargs):
+      result = None
+      start = t.perf_counter()
+      try:
+        result = function(*args, **kwargs)
+        return result
+      finally:
+        end = t.perf_counter()
+        self.record(name, category, start, end, argsFunction(result, *args, **kwargs) if argsFunction else None)
+    return traced
+
+  def summary(self):
+    # Returns a one-line summary of the stages since the last call and resets the counters.
+    with self.lock:
+      stats = self.stats
+      registers = self.registers
+      self.stats = {}
+      self.registers = {}
+    parts = []
+    for name in ("cycle", "query", "modbus", "serial", "export", "publish", "log"):
+      if name in stats:
+        count, total, longest, overhead = stats[name]
+        parts.append(f"{name} n={count} total={total * 1000:.1f}ms avg={total / count * 1000:.2f}ms max={longest * 1000:.2f}ms")
+      if name == "serial" and "modbus" in stats and "serial" in stats:
+        # minimalmodbus decodes inside its read calls: decode is the Modbus time that is
+        # neither serial I/O nor tracing overhead of the nested serial spans.
+        count, total = stats["modbus"][0], stats["modbus"][1] - stats["serial"][1] - stats["serial"][3]
+        total = max(0.0, total)
+        parts.append(f"decode n={count} total={total * 1000:.1f}ms avg={total / count * 1000:.2f}ms")
+    if registers:
+      register, (count, total, longest) = max(registers.items(), key=lambda item: item[1][1] / item[1][0])
+      parts.append(f"slowest register 0x{register:04X} n={count} avg={total / count * 1000:.2f}ms max={longest * 1000:.2f}ms")
+    return "; ".join(parts)
+
+  def save(self, fileName):
+    with self.lock:
+      events = list(self.events)
+    with open(fileName, "w") as fh:
+      json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh)
+
+
+# Args of the Modbus spans, matching the minimalmodbus signatures. The byte counts
+# are measured on the nested serial spans, as they depend on the mode (RTU/ASCII).
+def register_args(result, registeraddress, *args, **kwargs):
+  return {"register": registeraddress, "registers": 1}
+
+
+def float_args(result, registeraddress, functioncode=3, number_of_registers=2, *args, **kwargs):
+  return {"register": registeraddress, "registers": number_of_registers}
+
+
+# bytes_received is the length of the actual response, which is shorter than
+# bytes_expected on short frames and 0 when the transaction raised (e.g. timeout).
+def serial_args(result, request, number_of_bytes_to_read, *args, **kwargs):
+  return {"bytes_sent": len(request), "bytes_expected": number_of_bytes_to_read,
+          "bytes_received": 0 if result is None else len(result)}
@@ -0,0 +1,162 @@
+#
+# Tests for the ORNO Export Pipeline, run with: python3 -m pytest test_orno_export.py
+#
+import http.server
+import os
+import queue
+import tempfile
+import threading
+import time as t
+import unittest
+from datetime import datetime
+
+import orno_export
+
+try:
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+
+def record(voltage, pf=None):
+  return (datetime(2024, 1, 1, 12, 0, 0), {"L1_Voltage": voltage, "L1_PF": pf})
+
+
+class SlowWriter:
+  def __init__(self):
+    self.batches = []
+    self.closed = False
+
+  def write(self, batch):
+    t.sleep(0.2)
+    self.batches.append(batch)
+
+  def close(self):
+    self.closed = True
+
+
+class InfluxStandIn(http.server.BaseHTTPRequestHandler):
+  bodies = []
+
+  def do_POST(self):
+    InfluxStandIn.bodies.append((self.path, self.headers.get("Authorization"), self.rfile.read(int(self.headers["Content-Length"])).decode()))
+    self.send_response(204)
+    self.end_headers()
+
+  def log_message(self, *args):
+    pass
+
+
+class TestBatches(unittest.TestCase):
+  def test_flush_by_size(self):
+    records = queue.Queue()
+    for i in range(5):
+      records.put(record(230 + i))
+    generator = orno_export.batches(records, batch_size=2, flush_interval=60)
+    self.assertEqual(len(next(generator)), 2)
+    self.assertEqual(len(next(generator)), 2)
+
+  def test_flush_by_interval(self):
+    records = queue.Queue()
+    records.put(record(230))
+    start = t.monotonic()
+    batch = next(orno_export.batches(records, batch_size=100, flush_interval=0.2))
+    self.assertEqual(len(batch), 1)
+    self.assertGreaterEqual(t.monotonic() - start, 0.2)
+
+  def test_flush_on_stop(self):
+    records = queue.Queue()
+    stop = threading.Event()
+    records.put(record(230))
+    records.put(record(231))
+    stop.set()
+    self.assertEqual([len(batch) for batch in orno_export.batches(records, 100, 60, stop)], [2])
+
+
+class TestSink(unittest.TestCase):
+  def test_offer_never_blocks_and_counts_dropped(self):
+    writer = SlowWriter()
+    sink = orno_export.Sink(writer, batch_size=1, flush_interval=60, queue_size=2, logger=lambda message: None)
+    start = t.monotonic()
+    for i in range(20):
+      sink.offer(record(230 + i))
+    self.assertLess(t.monotonic() - start, 0.1)
+    sink.close()
+    self.assertGreater(sink.dropped, 0)
+    self.assertEqual(sink.dropped + sink.written, 20)
+    self.assertTrue(writer.closed)
+
+
+class TestWriters(unittest.TestCase):
+  def setUp(self):
+    self.tmp = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmp.cleanup()
+
+  def test_csv(self):
+    fileName = os.path.join(self.tmp.name, "smartMeter.csv")
+    writer = orno_export.CSVWriter(fileName)
+    writer.write([record(230.5), record(231.0, 0.9)])
+    writer.close()
+    with open(fileName) as fh:
+      self.assertEqual(fh.read().splitlines(), ["time,L1_Voltage,L1_PF",
+                                                "2024-01-01T12:00:00,230.5,",
+                                                "2024-01-01T12:00:00,231.0,0.9"])
+
+  @unittest.skipUnless(pyarrow, "requires pyarrow")
+  def test_parquet_row_groups(self):
+    fileName = os.path.join(self.tmp.name, "smartMeter.parquet")
+    writer = orno_export.ParquetWriter(fileName)
+    writer.write([record(230.5), record(231.0)])
+    writer.write([record(232.0, 0.9)])
+    writer.close()
+    parquetFile = pyarrow.parquet.ParquetFile(fileName)
+    self.assertEqual(parquetFile.num_row_groups, 2)
+    table = parquetFile.read()
+    self.assertEqual(table.column("L1_Voltage").to_pylist(), [230.5, 231.0, 232.0])
+    self.assertEqual(table.column("L1_PF").to_pylist(), [None, None, 0.9])
+    self.assertEqual(table.schema.field("L1_PF").type, pyarrow.float64())
+
+  @unittest.skipUnless(pyarrow, "requires pyarrow")
+  def test_parquet_int_values(self):
+    fileName = os.path.join(self.tmp.name, "smartMeter.parquet")
+    writer = orno_export.ParquetWriter(fileName)
+    writer.write([record(230)])
+    writer.write([record(231.5, 1)])
+    writer.close()
+    self.assertEqual(pyarrow.parquet.read_table(fileName).column("L1_Voltage").to_pylist(), [230.0, 231.5])
+
+  def test_line_protocol(self):
+    timestamp = int(datetime(2024, 1, 1, 12, 0, 0).timestamp()) * 1000000000
+    lines = orno_export.influx_lines([record(230.5), record(float("nan"), float("inf")), record(231.0, 0.9)], tags={"meter": "WE 517"})
+    self.assertEqual(lines, [f"SmartMeter,meter=WE\\ 517 L1_Voltage=230.5 {timestamp}",
+                             f"SmartMeter,meter=WE\\ 517 L1_Voltage=231.0,L1_PF=0.9 {timestamp}"])
+
+  def test_line_protocol_file(self):
+    fileName = os.path.join(self.tmp.name, "smartMeter.lp")
+    writer = orno_export.InfluxFileWriter(fileName)
+    writer.write([record(230.5)])
+    writer.close()
+    with open(fileName) as fh:
+      self.assertTrue(fh.read().startswith("SmartMeter L1_Voltage=230.5 "))
+
+  def test_influx_http(self):
+    InfluxStandIn.bodies = []
+    server = http.server.HTTPServer(("127.0.0.1", 0), InfluxStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+      writer = orno_export.InfluxHTTPWriter(f"http://127.0.0.1:{server.server_port}/write?db=smartmeter", token="secret")
+      writer.write([record(230.5), record(231.0)])
+    finally:
+      server.shutdown()
+      server.server_close()
+    self.assertEqual(len(InfluxStandIn.bodies), 1)
+    path, authorization, body = InfluxStandIn.bodies[0]
+    self.assertEqual(path, "/write?db=smartmeter")
+    self.assertEqual(authorization, "Token secret")
+    self.assertEqual(len(body.splitlines()), 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
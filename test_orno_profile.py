@@ -0,0 +1,102 @@
+#
+# Tests for ORNO Profiling, run with: python3 -m pytest test_orno_profile.py
+#
+import json
+import os
+import re
+import tempfile
+import time as t
+import unittest
+
+import orno_profile
+
+
+class FakeInstrument:
+  # Behaves like minimalmodbus.Instrument: read_float performs its serial I/O through
+  # _communicate. Register 0x0014 answers fast, 0x0020 slowly, 0x0030 with a short frame.
+  latency = {0x0014: 0.005, 0x0020: 0.02, 0x0030: 0.001}
+
+  def _communicate(self, request, number_of_bytes_to_read):
+    register = int.from_bytes(request[2:4], "big")
+    t.sleep(self.latency[register])
+    if register == 0x0030:
+      return b"\x01" * 6
+    return b"\x01" * number_of_bytes_to_read
+
+  def read_float(self, registeraddress, functioncode=3, number_of_registers=2, byteorder=0):
+    response = self._communicate(bytes([1, functioncode]) + registeraddress.to_bytes(2, "big") + bytes(4), 5 + 2 * number_of_registers)
+    return float(len(response))
+
+
+class TestTracer(unittest.TestCase):
+  def setUp(self):
+    self.tracer = orno_profile.Tracer()
+    self.instrument = FakeInstrument()
+    self.instrument._communicate = self.tracer.wrap(self.instrument._communicate, "serial", "bus", orno_profile.serial_args)
+    self.instrument.read_float = self.tracer.wrap(self.instrument.read_float, "modbus", "bus", orno_profile.float_args)
+
+  def poll(self):
+    # 0x0014 is read three times per cycle (L1/L2/L3 frequency on WE517), 0x0020 once.
+    for register in (0x0014, 0x0014, 0x0014, 0x0020):
+      self.instrument.read_float(register)
+
+  def test_summary_stages(self):
+    self.poll()
+    summary = self.tracer.summary()
+    self.assertRegex(summary, r"(^|; )modbus n=4 ")
+    self.assertRegex(summary, r"; serial n=4 ")
+    self.assertRegex(summary, r"; decode n=4 ")
+    decode = float(re.search(r"decode n=4 total=([0-9.]+)ms", summary).group(1))
+    self.assertLess(decode, 5.0)
+
+  def test_slowest_register_by_average(self):
+    self.poll()
+    summary = self.tracer.summary()
+    self.assertIn("slowest register 0x0020 n=1 ", summary)
+
+  def test_summary_resets_counters(self):
+    self.poll()
+    self.tracer.summary()
+    self.assertEqual(self.tracer.summary(), "")
+    self.instrument.read_float(0x0020)
+    self.assertRegex(self.tracer.summary(), r"(^|; )modbus n=1 ")
+
+  def test_serial_bytes_received(self):
+    self.instrument.read_float(0x0014)
+    self.instrument.read_float(0x0030)
+    serial = [event["args"] for event in self.tracer.events if event["name"] == "serial"]
+    self.assertEqual(serial[0], {"bytes_sent": 8, "bytes_expected": 9, "bytes_received": 9})
+    self.assertEqual(serial[1], {"bytes_sent": 8, "bytes_expected": 9, "bytes_received": 6})
+
+  def test_serial_exception(self):
+    def timeout(request, number_of_bytes_to_read):
+      raise IOError("No communication with the instrument (no answer)")
+    communicate = self.tracer.wrap(timeout, "serial", "bus", orno_profile.serial_args)
+    with self.assertRaises(IOError):
+      communicate(bytes(8), 9)
+    self.assertEqual(self.tracer.events[-1]["args"]["bytes_received"], 0)
+
+  def test_save_chrome_trace(self):
+    self.poll()
+    with tempfile.TemporaryDirectory() as tmp:
+      fileName = os.path.join(tmp, "trace.json")
+      self.tracer.save(fileName)
+      with open(fileName) as fh:
+        trace = json.load(fh)
+    events = trace["traceEvents"]
+    self.assertEqual(len(events), 8)
+    for event in events:
+      self.assertEqual(event["ph"], "X")
+      self.assertIn(event["name"], ("modbus", "serial"))
+    slow = [event for event in events if event["name"] == "serial"][-1]
+    # ts and dur are in microseconds
+    self.assertGreaterEqual(slow["dur"], 20000)
+    self.assertLess(slow["dur"], 1000000)
+    modbus = [event for event in events if event["name"] == "modbus"][-1]
+    self.assertLessEqual(modbus["ts"], slow["ts"])
+    self.assertGreaterEqual(modbus["ts"] + modbus["dur"], slow["ts"] + slow["dur"])
+    self.assertEqual(modbus["args"], {"register": 0x0020, "registers": 2})
+
+
+if __name__ == "__main__":
+  unittest.main()